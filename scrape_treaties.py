@@ -0,0 +1,755 @@
+"""Scrape international investment agreements from the UNCTAD Investment
+Policy Hub.
+
+For every country the hub lists, collect its bilateral investment treaties
+(BITs) and treaties with investment provisions (TIPs) from the country page
+table, then visit the detail page of each terminated treaty to record how it
+was terminated.  Results are checkpointed periodically and exported as CSV
+and JSON.
+"""
+
+import asyncio
+import csv
+import gzip
+import os
+import random
+import re
+import sys
+from pathlib import Path
+
+import httpx
+import orjson
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import TimeoutError as PlaywrightTimeout
+from playwright.async_api import async_playwright
+from selectolax.parser import HTMLParser
+
+BASE_URL = "https://investmentpolicy.unctad.org"
+COUNTRY_URL = f"{BASE_URL}/international-investment-agreements/countries"
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+)
+
+MAX_RETRIES = 3
+# The table is server-rendered: it is either there right after
+# domcontentloaded or it never will be, so don't poll for long.
+SELECTOR_TIMEOUT = 3_000
+POOL_SIZE = 16
+# The HTTP path is tens of KB per connection, so it can run far wider
+# than the browser pool.
+HTTP_CONCURRENCY = 50
+CHECKPOINT_EVERY = 10
+MAX_COUNTRY_ID = 250
+
+# Extract every treaty row in one in-browser pass.  Each protocol call
+# (query_selector, inner_text, ...) is a cross-process round-trip; walking
+# cells from Python costs hundreds of them per page, while this costs one.
+ROWS_JS = """
+() => Array.from(document.querySelectorAll('table tbody tr')).map(tr => {
+    const map = {};
+    tr.querySelectorAll('td[data-index]').forEach(c => {
+        map[c.dataset.index] = c.innerText.trim();
+    });
+    const a = tr.querySelector("a[href*='/treaties/']");
+    return {
+        treaty_url: a ? (a.getAttribute('href') || '') : '',
+        cell_map: map,
+        texts: Array.from(tr.querySelectorAll('td'), c => c.innerText.trim()),
+    };
+})
+"""
+
+# Same idea for the detail page: collect all form-group label/value pairs
+# in one pass and pick out the termination field in Python.
+FORM_GROUPS_JS = """
+() => Array.from(document.querySelectorAll('div.form-group')).map(g => {
+    const label = g.querySelector('label');
+    const value = g.querySelector('div, span, p');
+    return {
+        label: label ? label.innerText.trim() : '',
+        value: value ? value.innerText.trim() : '',
+    };
+})
+"""
+
+DATA_DIR = Path("data")
+RAW_DIR = DATA_DIR / "raw"
+SHARDS_DIR = DATA_DIR / "shards"
+COUNTRIES_FILE = DATA_DIR / "countries.json"
+CHECKPOINT_META = DATA_DIR / "checkpoint.json"
+OUTPUT_CSV = "treaties.csv"
+OUTPUT_JSON = "treaties.json"
+
+# Resource types that never contribute to the extracted data.
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet"}
+BLOCKED_HOSTS = ("google-analytics", "googletagmanager", "doubleclick")
+
+# Compiled once; parse_date and split_parties run on every row of every
+# country, so per-call pattern lookup adds up.
+_COUNTRY_RE = re.compile(r"/countries/(\d+)/([a-z0-9-]+)")
+_BIT_RE = re.compile(r"\bBITs?\b")
+_TIP_RE = re.compile(r"\bTIPs?\b")
+_DMY_DATE_RE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
+_ISO_DATE_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+_YEAR_RE = re.compile(r"(\d{4})")
+_PARTY_SEP_RE = re.compile(r"[-\u2013;,]")
+
+# Canonical country names, filled in once the country list is known;
+# lets split_parties resolve party strings by exact match.
+KNOWN_COUNTRY_NAMES = set()
+
+FIELDNAMES = [
+    "title",
+    "type",
+    "status",
+    "parties",
+    "date_signed",
+    "date_entry_into_force",
+    "termination_type",
+    "treaty_url",
+    "source_country",
+]
+
+
+class PagePool:
+    """A bounded pool of browser pages in one shared context.
+
+    Opening a page per task would let memory balloon with the number of
+    in-flight countries; instead up to ``size`` pages are opened lazily —
+    only when a worker actually needs the browser — and handed out via
+    ``async with pool.acquire() as page``.  With ``reuse_pages`` (the
+    default) released pages go back in the pool, amortizing the ~100 ms
+    ``new_page()``/``close()`` cost per task; set it to False to get a
+    fresh page per lease when state leakage between tasks matters.
+    """
+
+    def __init__(self, context, size=POOL_SIZE, reuse_pages=True):
+        self._context = context
+        self._size = size
+        self._reuse_pages = reuse_pages
+        self._pages = asyncio.Queue()
+        self._sem = asyncio.Semaphore(size)
+        self._opened = 0
+
+    async def _checkout(self):
+        await self._sem.acquire()
+        if self._pages.empty() and self._opened < self._size:
+            self._opened += 1
+            return await self._context.new_page()
+        return await self._pages.get()
+
+    async def _checkin(self, page):
+        if self._reuse_pages:
+            self._pages.put_nowait(page)
+        else:
+            self._opened -= 1
+            await page.close()
+        self._sem.release()
+
+    def acquire(self):
+        return _PageLease(self)
+
+    async def close(self):
+        while not self._pages.empty():
+            page = await self._pages.get()
+            await page.close()
+
+
+class _PageLease:
+    def __init__(self, pool):
+        self._pool = pool
+        self._page = None
+
+    async def __aenter__(self):
+        self._page = await self._pool._checkout()
+        return self._page
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._pool._checkin(self._page)
+        return False
+
+
+async def _block_heavy_resources(route):
+    """Abort requests for bytes we never read (images, fonts, analytics)."""
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(
+        host in request.url for host in BLOCKED_HOSTS
+    ):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def _sleep_backoff(retry_after, attempt):
+    """Honour a Retry-After header, else exponential backoff with jitter."""
+    if retry_after and retry_after.isdigit():
+        await asyncio.sleep(int(retry_after))
+    else:
+        await asyncio.sleep(2**attempt + random.random())
+
+
+async def retry_goto(page, url, retries=MAX_RETRIES):
+    """Navigate with retries and 429 backoff; returns True on success."""
+    for attempt in range(1, retries + 1):
+        try:
+            response = await page.goto(url, wait_until="domcontentloaded")
+        except PlaywrightError:
+            # Base class: timeouts, connection resets, DNS failures,
+            # aborted frames — all retried the same way, mirroring the
+            # httpx.HTTPError catch in retry_get.
+            if attempt == retries:
+                print(f"  giving up on {url} after {retries} attempts", file=sys.stderr)
+                return False
+            await _sleep_backoff(None, attempt)
+            continue
+        if response is not None and response.status == 429:
+            if attempt == retries:
+                print(f"  rate-limited on {url}, giving up", file=sys.stderr)
+                return False
+            await _sleep_backoff(response.headers.get("retry-after"), attempt)
+            continue
+        return True
+    return False
+
+
+async def retry_get(client, url, retries=MAX_RETRIES):
+    """GET with the same retry/backoff policy; returns None on failure."""
+    for attempt in range(1, retries + 1):
+        try:
+            resp = await client.get(url)
+        except httpx.HTTPError:
+            if attempt == retries:
+                return None
+            await _sleep_backoff(None, attempt)
+            continue
+        if resp.status_code == 429 and attempt < retries:
+            await _sleep_backoff(resp.headers.get("retry-after"), attempt)
+            continue
+        return resp
+    return None
+
+
+def _name_from_slug(slug):
+    """Last-resort country name when no display text is available."""
+    return slug.replace("-", " ").title()
+
+
+def _country_from_href(href, countries, name=""):
+    m = _COUNTRY_RE.search(href)
+    if not m:
+        return
+    cid, slug = int(m.group(1)), m.group(2)
+    # Prefer the display name from the element text: slugs lose hyphens
+    # and case ('guinea-bissau' -> 'Guinea Bissau', not 'Guinea-Bissau'),
+    # which would break the exact-match pass in split_parties.
+    name = (name or "").strip()
+    if cid not in countries:
+        countries[cid] = {
+            "id": cid,
+            "slug": slug,
+            "name": name or _name_from_slug(slug),
+        }
+    elif name:
+        countries[cid]["name"] = name
+
+
+async def _http_country_list(client):
+    """Enumerate countries from the raw HTML of one country page.
+
+    The page embeds a <select> of all countries plus in-page links, both
+    carrying ``/countries/<id>/<slug>`` URLs — static markup, so a plain
+    GET plus parser beats rendering it in a browser.
+    """
+    countries = {}
+    resp = await retry_get(client, f"{COUNTRY_URL}/1/afghanistan")
+    if resp is not None and resp.status_code == 200:
+        tree = HTMLParser(resp.text)
+        for option in tree.css("select option"):
+            _country_from_href(
+                option.attributes.get("value") or "", countries,
+                option.text(strip=True),
+            )
+        for link in tree.css("a[href*='/countries/']"):
+            _country_from_href(
+                link.attributes.get("href") or "", countries,
+                link.text(strip=True),
+            )
+    if not countries:
+        # Brute force: probe the whole id space concurrently.
+        sem = asyncio.Semaphore(20)
+
+        async def probe(cid):
+            async with sem:
+                try:
+                    resp = await client.get(
+                        f"{COUNTRY_URL}/{cid}/x", follow_redirects=True
+                    )
+                except httpx.HTTPError:
+                    return
+            if resp.status_code == 200:
+                _country_from_href(str(resp.url), countries)
+
+        await asyncio.gather(*(probe(cid) for cid in range(1, MAX_COUNTRY_ID + 1)))
+    return [countries[cid] for cid in sorted(countries)]
+
+
+async def get_country_list(context, client):
+    """Return [{'id': ..., 'slug': ..., 'name': ...}, ...] for every country.
+
+    Tries the cheap HTTP+parser path first and only falls back to a
+    rendered Playwright page if that yields nothing.
+    """
+    try:
+        countries = await _http_country_list(client)
+        if countries:
+            return countries
+    except httpx.HTTPError as exc:
+        print(f"HTTP country list failed ({exc}); falling back to browser",
+              file=sys.stderr)
+
+    page = await context.new_page()
+    countries = {}
+    try:
+        if await retry_goto(page, f"{COUNTRY_URL}/1/afghanistan"):
+            for option in await page.query_selector_all("select option"):
+                _country_from_href(
+                    await option.get_attribute("value") or "", countries,
+                    await option.inner_text(),
+                )
+            for link in await page.query_selector_all("a[href*='/countries/']"):
+                _country_from_href(
+                    await link.get_attribute("href") or "", countries,
+                    await link.inner_text(),
+                )
+    finally:
+        await page.close()
+    return [countries[cid] for cid in sorted(countries)]
+
+
+def archive_html(country, html):
+    """Keep the raw country page on disk, gzipped.
+
+    Decouples extraction from crawling: a parser bug means re-running
+    --reparse over the archive in seconds instead of hitting the server
+    for hours.
+    """
+    RAW_DIR.mkdir(parents=True, exist_ok=True)
+    path = RAW_DIR / f"{country['id']}_{country['slug']}.html.gz"
+    with gzip.open(path, "wb") as f:
+        f.write(html.encode("utf-8"))
+
+
+def _parse_rows_html(html):
+    """Parse treaty rows out of raw country-page HTML (same shape as ROWS_JS)."""
+    rows = []
+    for tr in HTMLParser(html).css("table tbody tr"):
+        texts = [cell.text(strip=True) for cell in tr.css("td")]
+        cell_map = {
+            cell.attributes["data-index"]: cell.text(strip=True)
+            for cell in tr.css("td[data-index]")
+        }
+        link = tr.css_first("a[href*='/treaties/']")
+        href = (link.attributes.get("href") or "") if link else ""
+        rows.append({"treaty_url": href, "cell_map": cell_map, "texts": texts})
+    return rows
+
+
+async def probe_server_side_table(client, country):
+    """True if the treaty table is present in the raw HTML response.
+
+    The table almost always renders server-side; when it does, every
+    country can be scraped with the HTTP client instead of a 50-200 MB
+    browser page, so we check once up front.
+    """
+    resp = await retry_get(client, f"{COUNTRY_URL}/{country['id']}/{country['slug']}")
+    if resp is None or resp.status_code != 200:
+        return False
+    return bool(_parse_rows_html(resp.text))
+
+
+async def scrape_country_treaties_http(client, country):
+    """HTTP counterpart of scrape_country_treaties; [] means fall back."""
+    resp = await retry_get(client, f"{COUNTRY_URL}/{country['id']}/{country['slug']}")
+    if resp is None or resp.status_code != 200:
+        return []
+    archive_html(country, resp.text)
+    return [
+        _normalize_row(row["treaty_url"], row["cell_map"], row["texts"], country)
+        for row in _parse_rows_html(resp.text)
+        if row["texts"]
+    ]
+
+
+async def scrape_country_treaties(page, country):
+    """Scrape the treaty table on one country page.
+
+    Returns None when navigation failed outright, so the caller can
+    tell a fetch failure apart from a country with no treaties.
+    """
+    url = f"{COUNTRY_URL}/{country['id']}/{country['slug']}"
+    if not await retry_goto(page, url):
+        return None
+    # Immediate DOM probe first; only poll briefly if the row isn't
+    # there yet.  Countries with no treaties fail fast instead of
+    # sitting out the full selector timeout.
+    if not await page.query_selector("table tbody tr"):
+        try:
+            await page.wait_for_selector("table tbody tr", timeout=SELECTOR_TIMEOUT)
+        except PlaywrightTimeout:
+            return []
+
+    archive_html(country, await page.content())
+    rows = await page.evaluate(ROWS_JS)
+    return [
+        _normalize_row(row["treaty_url"], row["cell_map"], row["texts"], country)
+        for row in rows
+        if row["texts"]
+    ]
+
+
+def _normalize_row(href, cell_map, texts, country):
+    """Turn raw row data into the treaty dict shape we export."""
+    # Rows without a treaty link keep an empty URL; prefixing BASE_URL
+    # onto "" would give every link-less treaty the same truthy URL and
+    # defeat the URL-based dedup.
+    if href and not href.startswith("http"):
+        href = f"{BASE_URL}{href}"
+    title = cell_map.get("title") or (texts[1] if len(texts) > 1 else "")
+    treaty_type = cell_map.get("type", "")
+    if not treaty_type:
+        joined = " ".join(texts)
+        if _BIT_RE.search(joined):
+            treaty_type = "BIT"
+        elif _TIP_RE.search(joined):
+            treaty_type = "TIP"
+    return {
+        "title": title,
+        "type": treaty_type,
+        "status": cell_map.get("status", ""),
+        "parties": "; ".join(split_parties(cell_map.get("parties", ""))),
+        "date_signed": cell_map.get("date_signed", ""),
+        "date_entry_into_force": cell_map.get("date_entry", ""),
+        "termination_type": "",
+        "treaty_url": href,
+        "source_country": country["name"],
+    }
+
+
+def _is_termination_type_label(text):
+    """Match 'Type of termination' / 'Termination type' but not e.g.
+    'Date of termination', which precedes it on the detail page."""
+    lowered = text.lower()
+    return "termination" in lowered and "type" in lowered
+
+
+async def scrape_termination_type_http(client, url):
+    """HTTP counterpart of scrape_termination_type.
+
+    Returns the field value ('' when the page has none) or None when the
+    fetch itself failed and the browser should take over.
+    """
+    resp = await retry_get(client, url)
+    if resp is None or resp.status_code != 200:
+        return None
+    for group in HTMLParser(resp.text).css("div.form-group"):
+        label = group.css_first("label")
+        if label is None:
+            continue
+        label_text = label.text(strip=True)
+        if _is_termination_type_label(label_text):
+            value = group.text(separator=" ", strip=True)
+            return value.replace(label_text, "", 1).strip()
+    return ""
+
+
+async def scrape_termination_type(page, treaty):
+    """Read the 'Termination type' field off a treaty detail page."""
+    if not await retry_goto(page, treaty["treaty_url"]):
+        return ""
+    for group in await page.evaluate(FORM_GROUPS_JS):
+        if _is_termination_type_label(group["label"]):
+            return group["value"]
+    return ""
+
+
+def parse_date(text):
+    """Normalize the hub's date strings to ISO yyyy-mm-dd (best effort)."""
+    if not text:
+        return ""
+    m = _DMY_DATE_RE.search(text)
+    if m:
+        return f"{m.group(3)}-{int(m.group(2)):02d}-{int(m.group(1)):02d}"
+    m = _ISO_DATE_RE.search(text)
+    if m:
+        return m.group(0)
+    m = _YEAR_RE.search(text)
+    if m:
+        return m.group(1)
+    return ""
+
+
+def split_parties(text):
+    """Split a parties string like 'Austria - Chile' into its country names.
+
+    Country names themselves can contain the separators ('Guinea-Bissau',
+    'Bosnia and Herzegovina'), so first look for a separator where both
+    sides are known country names — one pass against a precomputed set,
+    and immune to heuristic misfires like 'Republic of Korea'.  Only when
+    no exact pair matches, fall back to a plain separator split — best
+    effort, but it never glues two parties into one.
+    """
+    if not text:
+        return []
+    if KNOWN_COUNTRY_NAMES:
+        for m in _PARTY_SEP_RE.finditer(text):
+            left = text[: m.start()].strip()
+            right = text[m.end() :].strip()
+            if left in KNOWN_COUNTRY_NAMES and right in KNOWN_COUNTRY_NAMES:
+                return [left, right]
+    return [t.strip() for t in _PARTY_SEP_RE.split(text) if t.strip()]
+
+
+def save_country_names(countries):
+    """Persist the scraped country list so --reparse keeps the display
+    names instead of regressing to slug-derived ones."""
+    DATA_DIR.mkdir(exist_ok=True)
+    with open(COUNTRIES_FILE, "wb") as f:
+        f.write(orjson.dumps(countries))
+
+
+def load_country_names():
+    """id -> display name from a previous run, or {} when absent."""
+    if not COUNTRIES_FILE.exists():
+        return {}
+    try:
+        countries = orjson.loads(COUNTRIES_FILE.read_bytes())
+    except orjson.JSONDecodeError:
+        return {}
+    return {c["id"]: c["name"] for c in countries}
+
+
+def write_shard(country, treaties):
+    """Write one country's treaties to its own shard file.
+
+    Workers each own their shard, so no lock guards the hot path; a
+    shard only appears under its final name once fully written (temp
+    file + rename), and an existing shard — even an empty one — marks
+    its country as done for resume.
+    """
+    SHARDS_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = SHARDS_DIR / f"{country['id']}.tmp"
+    with open(tmp, "wb") as f:
+        for treaty in treaties:
+            f.write(orjson.dumps(treaty) + b"\n")
+    os.replace(tmp, SHARDS_DIR / f"{country['id']}.jsonl")
+
+
+def completed_shard_ids():
+    """Country ids with a finished shard on disk."""
+    if not SHARDS_DIR.exists():
+        return set()
+    return {int(p.stem) for p in SHARDS_DIR.glob("*.jsonl")}
+
+
+def merge_shards():
+    """Concatenate all shards, dropping duplicate treaty URLs.
+
+    Every treaty appears on both parties' pages; deduplicating here —
+    before step 5 — keeps each detail page to a single fetch.
+    """
+    treaties = []
+    seen_urls = set()
+    for path in sorted(SHARDS_DIR.glob("*.jsonl"), key=lambda p: int(p.stem)):
+        for line in path.read_bytes().splitlines():
+            if not line.strip():
+                continue
+            try:
+                treaty = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue
+            url = treaty.get("treaty_url", "")
+            if url:
+                if url in seen_urls:
+                    continue
+                seen_urls.add(url)
+            treaties.append(treaty)
+    return treaties
+
+
+def save_checkpoint_meta(completed, total):
+    """Atomically record scrape progress (write temp file, then rename)."""
+    tmp = CHECKPOINT_META.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps({"completed": completed, "total": total}))
+    os.replace(tmp, CHECKPOINT_META)
+
+
+def export(treaties):
+    import pandas as pd
+
+    # Parse the common dd/mm/yyyy case for the whole column in C;
+    # parse_date only runs on the leftovers to_datetime can't handle.
+    for col in ("date_signed", "date_entry_into_force"):
+        raw = pd.Series([t.get(col, "") for t in treaties], dtype="object")
+        parsed = pd.to_datetime(raw, format="%d/%m/%Y", errors="coerce")
+        normalized = parsed.dt.strftime("%Y-%m-%d").fillna(raw.map(parse_date))
+        for treaty, value in zip(treaties, normalized):
+            treaty[col] = value
+
+    def rows():
+        for treaty in treaties:
+            yield {k: treaty.get(k, "") for k in FIELDNAMES}
+
+    # One pass feeds both files; no second full copy of the data just
+    # for the JSON export.
+    count = 0
+    with open(OUTPUT_CSV, "w", newline="", encoding="utf-8") as csv_f, \
+            open(OUTPUT_JSON, "wb") as json_f:
+        writer = csv.DictWriter(csv_f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        json_f.write(b"[")
+        for count, row in enumerate(rows(), start=1):
+            writer.writerow(row)
+            if count > 1:
+                json_f.write(b",\n")
+            json_f.write(orjson.dumps(row))
+        json_f.write(b"]\n")
+    print(f"wrote {count} treaties to {OUTPUT_CSV} / {OUTPUT_JSON}")
+
+
+async def main():
+    client = httpx.AsyncClient(
+        headers={"User-Agent": USER_AGENT},
+        timeout=30.0,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=HTTP_CONCURRENCY),
+    )
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context(user_agent=USER_AGENT)
+        await context.route("**/*", _block_heavy_resources)
+
+        # Step 1: enumerate countries.
+        countries = await get_country_list(context, client)
+        KNOWN_COUNTRY_NAMES.update(c["name"] for c in countries)
+        save_country_names(countries)
+        print(f"found {len(countries)} countries")
+
+        pool = PagePool(context, size=POOL_SIZE, reuse_pages=True)
+
+        # Probe once: if the table renders server-side we can skip the
+        # browser for the whole table-scraping step.
+        use_http = countries and await probe_server_side_table(client, countries[0])
+        print(f"treaty tables render server-side: {use_http}")
+        http_sem = asyncio.Semaphore(HTTP_CONCURRENCY)
+
+        # Steps 2-4: scrape every country page, over HTTP when possible.
+        # Each worker writes its own shard — no shared list, no lock —
+        # and countries with a shard on disk are already done.
+        DATA_DIR.mkdir(exist_ok=True)
+        done_ids = completed_shard_ids()
+        if done_ids:
+            countries = [c for c in countries if c["id"] not in done_ids]
+            print(f"resuming: {len(done_ids)} shards on disk, "
+                  f"{len(countries)} countries left")
+        completed = 0
+
+        async def country_worker(country):
+            nonlocal completed
+            treaties = []
+            if use_http:
+                async with http_sem:
+                    treaties = await scrape_country_treaties_http(client, country)
+            if not treaties:
+                async with pool.acquire() as page:
+                    treaties = await scrape_country_treaties(page, country)
+            completed += 1
+            if treaties is None:
+                # No shard: an existing shard marks the country done, and
+                # a transient fetch failure must be retried on resume.
+                print(f"[{completed}/{len(countries)}] {country['name']}: "
+                      f"fetch failed, left for next run", file=sys.stderr)
+            else:
+                write_shard(country, treaties)
+                print(f"[{completed}/{len(countries)}] {country['name']}: "
+                      f"{len(treaties)} treaties")
+            if completed % CHECKPOINT_EVERY == 0:
+                save_checkpoint_meta(completed, len(countries))
+
+        await asyncio.gather(*(country_worker(c) for c in countries))
+
+        # One merge pass over the shards dedups treaty URLs before the
+        # detail fetches in step 5.
+        unique = merge_shards()
+        print(f"{len(unique)} unique treaties merged from shards")
+
+        # Step 5: terminated treaties record how they ended on their
+        # detail page; fetch those in parallel too.  Link-less rows have
+        # no detail page to visit.
+        terminated = [
+            t for t in unique
+            if t["treaty_url"] and "terminat" in t["status"].lower()
+        ]
+        print(f"fetching termination type for {len(terminated)} treaties")
+
+        async def detail_worker(treaty):
+            # Detail pages are static HTML; only fall back to the browser
+            # when the HTTP fetch itself fails.
+            async with http_sem:
+                value = await scrape_termination_type_http(client, treaty["treaty_url"])
+            if value is None:
+                async with pool.acquire() as page:
+                    value = await scrape_termination_type(page, treaty)
+            treaty["termination_type"] = value
+
+        await asyncio.gather(*(detail_worker(t) for t in terminated))
+
+        await pool.close()
+        await browser.close()
+    await client.aclose()
+
+    save_checkpoint_meta(completed, completed)
+    export(unique)
+
+
+def reparse():
+    """Rebuild the exports from the HTML archive, no network involved."""
+    treaties = []
+    seen_urls = set()
+    names = load_country_names()
+    archived = []
+    for path in sorted(RAW_DIR.glob("*.html.gz")):
+        cid, _, slug = path.name[: -len(".html.gz")].partition("_")
+        archived.append((path, {
+            "id": int(cid),
+            "slug": slug,
+            "name": names.get(int(cid)) or _name_from_slug(slug),
+        }))
+    # split_parties needs the canonical names before any row is parsed.
+    KNOWN_COUNTRY_NAMES.update(country["name"] for _, country in archived)
+    for path, country in archived:
+        with gzip.open(path, "rb") as f:
+            html = f.read().decode("utf-8")
+        for row in _parse_rows_html(html):
+            if not row["texts"]:
+                continue
+            treaty = _normalize_row(
+                row["treaty_url"], row["cell_map"], row["texts"], country
+            )
+            url = treaty["treaty_url"]
+            if url:
+                if url in seen_urls:
+                    continue
+                seen_urls.add(url)
+            treaties.append(treaty)
+    print(f"reparsed {len(treaties)} treaties from {RAW_DIR}")
+    export(treaties)
+
+
+if __name__ == "__main__":
+    if "--reparse" in sys.argv[1:]:
+        reparse()
+    else:
+        asyncio.run(main())